@@ -1,23 +1,37 @@
 # App.py
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import click
+import glob
+import gzip
 import json
 import os
 import logging
+import math
 import random
-from sqlalchemy import text
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text, func
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash, check_password_hash
 
 logging.basicConfig(level=logging.INFO)
 log = logging.getLogger(__name__)
 
 app = Flask(__name__)
+# Number of proxies in front of the app whose X-Forwarded-For hops are trusted.
+# Defaults to 0 (local / direct access: XFF is ignored); the Procfile sets 1 for
+# Heroku, whose router appends the real client IP as the last hop. remote_addr is
+# only spoof-proof when this matches the actual number of proxies.
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=int(os.environ.get("TRUSTED_PROXY_COUNT", 0)))
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# SQLite DB file next to app.py
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///company.db'
+# SQLite DB file next to app.py (COMPANY_DB_URI lets tests point at a scratch DB)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("COMPANY_DB_URI", 'sqlite:///company.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
@@ -81,6 +95,7 @@ class Feedback(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     employee_name = db.Column(db.String(100), nullable=False)
     feedback_text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.String(20), default=lambda: datetime.utcnow().strftime("%Y-%m-%d"))
 
 
 # Todo model
@@ -91,6 +106,15 @@ class Todo(db.Model):
     task = db.Column(db.String(255), nullable=False)
     is_completed = db.Column(db.Boolean, default=False)
     due_date = db.Column(db.String(30), nullable=True)  # store as YYYY-MM-DD string
+    completed_at = db.Column(db.String(20), nullable=True)  # YYYY-MM-DD, set when marked completed
+
+
+# Trigram index over candidate name/email (used by fuzzy lookup + dedupe)
+class CandidateTrigram(db.Model):
+    __tablename__ = "candidate_trigram"
+    trigram = db.Column(db.String(3), primary_key=True)
+    candidate_id = db.Column(db.Integer, primary_key=True, index=True)
+    field = db.Column(db.String(10), primary_key=True)  # 'name' or 'email'
 
 
 # -----------------------
@@ -141,13 +165,15 @@ def ensure_table_and_columns():
         },
         "feedback": {
             "employee_name": "VARCHAR(100)",
-            "feedback_text": "TEXT"
+            "feedback_text": "TEXT",
+            "created_at": "VARCHAR(20)"
         },
         "todo": {
             "employee_name": "VARCHAR(100)",
             "task": "VARCHAR(255)",
             "is_completed": "BOOLEAN DEFAULT 0",
-            "due_date": "VARCHAR(30)"
+            "due_date": "VARCHAR(30)",
+            "completed_at": "VARCHAR(20)"
         }
     }
 
@@ -172,6 +198,143 @@ def ensure_table_and_columns():
                 log.warning("Failed to add column %s to %s: %s", col, table, e)
 
 
+# -----------------------
+# Candidate trigram index (fuzzy name/email matching)
+# -----------------------
+# Names are compared with spaces/punctuation stripped, so "Tan Ze Qi" and "Tan Zeqi"
+# share every trigram. Emails are compared on the local part only.
+LOOKUP_PREFILTER = 50        # (candidate, field) pairs pulled from the index before re-ranking
+LOOKUP_MIN_SCORE = 0.3
+VERIFY_MIN_SCORE = 0.6       # name similarity accepted by /verify_candidate once the IC matches
+DUPLICATE_MIN_SCORE = 0.6
+DUPLICATE_MAX_POSTING = 200  # trigrams shared by more candidates than this are too common to pick pairs
+
+
+def normalize_for_match(value, field="name"):
+    value = (value or "").strip().lower()
+    if field == "email" or "@" in value:
+        value = value.split("@", 1)[0]
+    return "".join(ch for ch in value if ch.isalnum())
+
+
+def trigrams(value, field="name"):
+    norm = normalize_for_match(value, field)
+    if not norm:
+        return set()
+    padded = f"  {norm} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def similarity(a, b):
+    """Jaccard similarity of two trigram sets (0..1)."""
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def candidate_trigram_rows(c: Candidate):
+    rows = [CandidateTrigram(trigram=t, candidate_id=c.id, field="name") for t in trigrams(c.name, "name")]
+    rows += [CandidateTrigram(trigram=t, candidate_id=c.id, field="email") for t in trigrams(c.email, "email")]
+    return rows
+
+
+def index_candidate(c: Candidate):
+    """(Re)index one candidate's name/email trigrams. Best effort: lookup just misses it on failure."""
+    try:
+        CandidateTrigram.query.filter_by(candidate_id=c.id).delete()
+        db.session.add_all(candidate_trigram_rows(c))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.warning("Failed to index candidate %s: %s", c.id, e)
+
+
+def rebuild_candidate_trigrams():
+    CandidateTrigram.query.delete()
+    count = 0
+    for c in Candidate.query.all():
+        db.session.add_all(candidate_trigram_rows(c))
+        count += 1
+    db.session.commit()
+    log.info("Rebuilt candidate trigram index for %d candidates", count)
+
+
+def lookup_candidates(q, limit=10, min_score=LOOKUP_MIN_SCORE):
+    """Ranked fuzzy matches for q against candidate names and emails: [(score, candidate), ...]."""
+    q_name, q_email = trigrams(q, "name"), trigrams(q, "email")
+    probe = q_name | q_email
+    if not probe:
+        return []
+    hits = (
+        db.session.query(CandidateTrigram.candidate_id, func.count().label("shared"))
+        .filter(CandidateTrigram.trigram.in_(probe))
+        .group_by(CandidateTrigram.candidate_id, CandidateTrigram.field)
+        .order_by(text("shared DESC"))
+        .limit(LOOKUP_PREFILTER)
+        .all()
+    )
+    ids = {h.candidate_id for h in hits}
+    if not ids:
+        return []
+
+    scored = []
+    for c in Candidate.query.filter(Candidate.id.in_(ids)).all():
+        score = max(similarity(q_name, trigrams(c.name, "name")),
+                    similarity(q_email, trigrams(c.email, "email")))
+        if score >= min_score:
+            scored.append((score, c))
+    scored.sort(key=lambda sc: (-sc[0], sc[1].id))
+    return scored[:limit]
+
+
+def find_duplicate_clusters(min_score=DUPLICATE_MIN_SCORE):
+    """
+    Group candidates whose names are likely the same person.
+    Candidate pairs come from the trigram postings (blocking), not an all-pairs scan;
+    each pair is then scored on its full trigram sets and pairs above min_score are
+    merged with union-find.
+    """
+    postings = {}
+    grams = {}
+    for t, cid in db.session.query(CandidateTrigram.trigram, CandidateTrigram.candidate_id).filter_by(field="name"):
+        postings.setdefault(t, []).append(cid)
+        grams.setdefault(cid, set()).add(t)
+
+    parent = {}
+
+    def find(x):
+        while parent.get(x, x) != x:
+            parent[x] = parent.get(parent[x], parent[x])
+            x = parent[x]
+        return x
+
+    best = {}
+    for cid, mine in grams.items():
+        pairs = set()
+        for t in mine:
+            posting = postings[t]
+            if len(posting) > DUPLICATE_MAX_POSTING:
+                continue
+            pairs.update(other for other in posting if other > cid)
+        for other in pairs:
+            score = similarity(mine, grams[other])
+            if score < min_score:
+                continue
+            ra, rb = find(cid), find(other)
+            if ra != rb:
+                parent[rb] = ra
+            best[cid] = max(best.get(cid, 0), score)
+            best[other] = max(best.get(other, 0), score)
+
+    groups = {}
+    for cid in best:
+        groups.setdefault(find(cid), []).append(cid)
+    clusters = [sorted(ids) for ids in groups.values() if len(ids) > 1]
+    clusters.sort(key=lambda ids: ids[0])
+    return clusters, best
+
+
 # -----------------------
 # Create tables & seed demo users
 # -----------------------
@@ -212,6 +375,29 @@ with app.app_context():
         db.session.rollback()
         log.exception("Seeding demo users failed: %s", e)
 
+    # Rows from before the retention timestamps existed start aging from today.
+    # Ideas are left alone: submitted_at is user-visible, and NULL ones are simply never archived.
+    try:
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        db.session.execute(text("UPDATE feedback SET created_at = :d WHERE created_at IS NULL"), {"d": today})
+        db.session.execute(text("UPDATE todo SET completed_at = :d WHERE is_completed = 1 AND completed_at IS NULL"), {"d": today})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        log.warning("Retention timestamp backfill failed: %s", e)
+
+    # Backfill the candidate trigram index for rows created before it existed
+    try:
+        # compare id sets, not counts: candidates with no alphanumeric name/email have no trigrams
+        indexed = {cid for (cid,) in db.session.query(CandidateTrigram.candidate_id).distinct()}
+        expected = {cid for cid, name, email in db.session.query(Candidate.id, Candidate.name, Candidate.email)
+                    if trigrams(name, "name") or trigrams(email, "email")}
+        if indexed != expected:
+            rebuild_candidate_trigrams()
+    except Exception as e:
+        db.session.rollback()
+        log.exception("Candidate trigram backfill failed: %s", e)
+
 
 # -----------------------
 # Helpers
@@ -240,6 +426,368 @@ def candidate_to_resume(c: Candidate):
     }
 
 
+# -----------------------
+# Retention / archival
+# -----------------------
+# Old rows are moved out of company.db into gzip NDJSON segments under
+# instance/archive/<table>/, one segment per batch. Ages are YYYY-MM-DD strings,
+# so rows whose age column is not in that format (or NULL) are never archived.
+# The job runs on a timer inside the web process, because it has to act on the
+# web dyno's own company.db (a one-off/scheduler dyno only sees a throwaway copy).
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR") or os.path.join(app.instance_path, "archive")
+RETENTION_BATCH_SIZE = 500
+RETENTION_INTERVAL_HOURS = float(os.environ.get("RETENTION_INTERVAL_HOURS", 24))  # 0 disables the timer
+RETENTION_START_DELAY = 600  # seconds after the first request before the first run
+ARCHIVE_PAGE_SIZE = 100
+ARCHIVE_MAX_PAGE_SIZE = 1000
+RETENTION_POLICIES = {
+    "feedback": {"model": Feedback, "age_column": "created_at",
+                 "days": int(os.environ.get("RETENTION_DAYS_FEEDBACK", 180))},
+    "idea": {"model": Idea, "age_column": "submitted_at",
+             "days": int(os.environ.get("RETENTION_DAYS_IDEA", 365))},
+    # tasks have no completion time, so Done tasks age by their scheduled date;
+    # unfinished tasks always stay in the hot list
+    "task": {"model": Task, "age_column": "date", "where": Task.status == "Done",
+             "days": int(os.environ.get("RETENTION_DAYS_TASK", 180))},
+    # only completed todos are archived, aged from when they were completed
+    "todo": {"model": Todo, "age_column": "completed_at", "where": Todo.is_completed.is_(True),
+             "days": int(os.environ.get("RETENTION_DAYS_TODO", 30))},
+}
+_retention_lock = threading.Lock()
+_retention_timer_lock = threading.Lock()
+_retention_timer_started = False
+
+
+def row_to_dict(row):
+    return {col.name: getattr(row, col.name) for col in row.__table__.columns}
+
+
+def write_archive_segment(table, rows):
+    """
+    Write rows as one gzip NDJSON segment plus a small .idx.json sidecar (row count,
+    employee names) so readers can skip segments without decompressing them.
+    The segment is written to a temp file and renamed so readers never see half of one.
+    """
+    folder = os.path.join(ARCHIVE_DIR, table)
+    os.makedirs(folder, exist_ok=True)
+    name = f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{rows[0]['id']}-{rows[-1]['id']}.ndjson.gz"
+    path = os.path.join(folder, name)
+    idx = {"count": len(rows)}
+    if "employee_name" in rows[0]:
+        idx["employees"] = sorted({r["employee_name"] for r in rows if r["employee_name"]})
+    with open(path + ".idx.json", "w", encoding="utf-8") as f:
+        json.dump(idx, f)
+    tmp = path + ".tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        for r in rows:
+            f.write(json.dumps(r) + "\n")
+    os.replace(tmp, path)
+    return path
+
+
+def segment_may_contain(path, employee_name):
+    try:
+        with open(path + ".idx.json", encoding="utf-8") as f:
+            employees = json.load(f).get("employees")
+    except (OSError, ValueError):
+        return True  # no usable sidecar: read the segment
+    return employees is None or employee_name in employees
+
+
+def read_archive(table, newest_first=False, limit=ARCHIVE_PAGE_SIZE, offset=0, employee_name=None):
+    """
+    One page of archived rows as attribute-style objects (same field names as the model),
+    in archive order. Segments are read lazily and reading stops once the page is full.
+    """
+    paths = sorted(glob.glob(os.path.join(ARCHIVE_DIR, table, "*.ndjson.gz")), reverse=newest_first)
+    out = []
+    seen = set()
+    skipped = 0
+    for path in paths:
+        if employee_name is not None and not segment_may_contain(path, employee_name):
+            continue
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                rows = [json.loads(line) for line in f if line.strip()]
+        except (OSError, ValueError) as e:
+            log.warning("Skipping unreadable archive segment %s: %s", path, e)
+            continue
+        if newest_first:
+            rows.reverse()
+        for r in rows:
+            if employee_name is not None and r.get("employee_name") != employee_name:
+                continue
+            # ids are reused once the newest rows are deleted, so only an identical row is a
+            # duplicate (a crash between writing a segment and deleting its rows archives it twice)
+            key = json.dumps(r, sort_keys=True)
+            if key in seen:
+                continue
+            seen.add(key)
+            if skipped < offset:
+                skipped += 1
+                continue
+            out.append(SimpleNamespace(**r))
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def archive_table(table, policy, batch_size=RETENTION_BATCH_SIZE, max_batches=None):
+    model = policy["model"]
+    age_col = getattr(model, policy["age_column"])
+    cutoff = (datetime.utcnow() - timedelta(days=policy["days"])).strftime("%Y-%m-%d")
+    archived = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        q = model.query.filter(age_col.isnot(None), age_col.like("____-__-__"), age_col < cutoff)
+        if policy.get("where") is not None:
+            q = q.filter(policy["where"])
+        rows = q.order_by(model.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        # segment first, delete second: a crash in between only duplicates, never loses rows
+        write_archive_segment(table, [row_to_dict(r) for r in rows])
+        ids = [r.id for r in rows]
+        try:
+            model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        archived += len(ids)
+        batches += 1
+    return archived
+
+
+def vacuum_database():
+    """
+    Give freed pages back to the filesystem. The first run switches the DB to
+    incremental auto_vacuum (needs one full VACUUM); later runs are incremental.
+    """
+    db.session.commit()
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        cur = conn.connection.driver_connection.cursor()
+        try:
+            before = cur.execute("PRAGMA freelist_count").fetchone()[0]
+            if cur.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                cur.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cur.execute("VACUUM")
+                mode = "full"
+            else:
+                # incremental_vacuum frees one page per step; cursor.execute() only steps a
+                # row-less statement once, executescript() runs it to completion
+                cur.executescript("PRAGMA incremental_vacuum;")
+                mode = "incremental"
+            after = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        finally:
+            cur.close()
+    if before and after >= before:
+        raise RuntimeError(f"{mode} vacuum left freelist at {after} pages (was {before})")
+    return {"mode": mode, "freed_pages": before - after}
+
+
+def run_retention(batch_size=RETENTION_BATCH_SIZE, max_batches=None, vacuum=True):
+    """Archive every table per RETENTION_POLICIES, then vacuum if anything moved."""
+    if not _retention_lock.acquire(blocking=False):
+        return None
+    try:
+        summary = {}
+        for table, policy in RETENTION_POLICIES.items():
+            try:
+                summary[table] = archive_table(table, policy, batch_size, max_batches)
+            except Exception as e:
+                log.exception("Archiving %s failed: %s", table, e)
+                summary[table] = {"error": str(e)}
+        moved = sum(v for v in summary.values() if isinstance(v, int))
+        vacuumed = None
+        if vacuum and moved:
+            try:
+                vacuumed = vacuum_database()
+            except Exception as e:
+                log.warning("VACUUM after retention failed: %s", e)
+        log.info("Retention run archived %d rows: %s", moved, summary)
+        return {"archived": summary, "vacuum": vacuumed}
+    finally:
+        _retention_lock.release()
+
+
+def retention_timer():
+    time.sleep(RETENTION_START_DELAY)
+    while True:
+        with app.app_context():
+            try:
+                run_retention()
+            except Exception as e:
+                log.exception("Scheduled retention run failed: %s", e)
+        time.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+
+@app.before_request
+def start_retention_timer():
+    # started on the first request so CLI commands and the debug reloader's parent never run it
+    global _retention_timer_started
+    if _retention_timer_started or RETENTION_INTERVAL_HOURS <= 0:
+        return None
+    with _retention_timer_lock:
+        if not _retention_timer_started:
+            threading.Thread(target=retention_timer, name="retention", daemon=True).start()
+            _retention_timer_started = True
+    return None
+
+
+def wants_archived():
+    return (request.args.get("archived") or "").lower() in ("1", "true", "yes")
+
+
+def archive_page():
+    """limit/offset query args for ?archived=true reads (bad values fall back to the defaults)."""
+    try:
+        limit = max(1, min(int(request.args.get("limit", ARCHIVE_PAGE_SIZE)), ARCHIVE_MAX_PAGE_SIZE))
+    except ValueError:
+        limit = ARCHIVE_PAGE_SIZE
+    try:
+        offset = max(0, int(request.args.get("offset", 0)))
+    except ValueError:
+        offset = 0
+    return limit, offset
+
+
+# -----------------------
+# Admission control (per-route concurrency + token-bucket rate limits)
+# -----------------------
+# Only the expensive routes are listed; anything not in here (e.g. /ping) skips
+# admission entirely so cheap routes keep answering while these shed load.
+# Limits are per process: the Procfile runs a single gunicorn worker with 12
+# threads, and the max_concurrent values below add up to 9 so at least 3 threads
+# are always left for unlisted routes. Keep that sum below --threads if either
+# changes, and remember extra workers multiply every limit.
+#   max_concurrent: requests allowed in flight at once for the route
+#   queue_timeout:  seconds to wait for a free slot before answering 503
+#   rate / burst:   token bucket refill per second / bucket size
+#   keys:           what the buckets are keyed on ("client" = IP, "user" = username in body)
+ROUTE_LIMITS = {
+    "login": {"max_concurrent": 4, "queue_timeout": 0.5, "rate": 1.0, "burst": 5, "keys": ["client", "user"]},
+    "create_user": {"max_concurrent": 2, "queue_timeout": 0.5, "rate": 0.5, "burst": 3, "keys": ["client"]},
+    "get_resumes": {"max_concurrent": 2, "queue_timeout": 0.25, "rate": 2.0, "burst": 5, "keys": ["client"]},
+    "candidate_duplicates": {"max_concurrent": 1, "queue_timeout": 0, "rate": 0.2, "burst": 2, "keys": ["client"]},
+}
+MAX_BUCKETS = 10000  # least recently used buckets are evicted beyond this many keys
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Take one token. Returns 0 if allowed, otherwise seconds until a token is free."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+_admission_lock = threading.Lock()
+_route_slots = {ep: threading.BoundedSemaphore(cfg["max_concurrent"]) for ep, cfg in ROUTE_LIMITS.items()}
+_buckets = OrderedDict()
+_admission_stats = {
+    ep: {"admitted": 0, "queued": 0, "inflight": 0, "rejected_rate": 0, "rejected_concurrency": 0}
+    for ep in ROUTE_LIMITS
+}
+
+
+def client_key():
+    # ProxyFix has already resolved the trusted X-Forwarded-For hop into remote_addr
+    return request.remote_addr or "unknown"
+
+
+def user_key():
+    data = request.get_json(silent=True) or {}
+    return (data.get("username") or data.get("preferredUsername") or data.get("preferred_username") or "").strip().lower()
+
+
+def take_token(endpoint, kind, key, cfg):
+    """Returns 0 if the (endpoint, kind, key) bucket allowed the request, else the retry delay."""
+    bucket_id = (endpoint, kind, key)
+    with _admission_lock:
+        bucket = _buckets.get(bucket_id)
+        if bucket is None:
+            if len(_buckets) >= MAX_BUCKETS:
+                _buckets.popitem(last=False)
+            bucket = _buckets[bucket_id] = TokenBucket(cfg["rate"], cfg["burst"])
+        else:
+            _buckets.move_to_end(bucket_id)
+        return bucket.take()
+
+
+def too_busy(status, message, retry_after):
+    resp = jsonify({"error": message, "retry_after": retry_after})
+    resp.status_code = status
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp
+
+
+@app.before_request
+def admit_request():
+    endpoint = request.endpoint
+    cfg = ROUTE_LIMITS.get(endpoint)
+    if cfg is None or request.method == "OPTIONS":
+        return None
+    stats = _admission_stats[endpoint]
+
+    # rate limits first: rejecting here costs nothing and never holds a slot
+    for kind in cfg["keys"]:
+        key = client_key() if kind == "client" else user_key()
+        if not key:
+            continue
+        wait = take_token(endpoint, kind, key, cfg)
+        if wait:
+            with _admission_lock:
+                stats["rejected_rate"] += 1
+            return too_busy(429, "rate limit exceeded", max(1, math.ceil(wait)))
+
+    slots = _route_slots[endpoint]
+    if not slots.acquire(blocking=False):
+        with _admission_lock:
+            stats["queued"] += 1
+        # short bounded wait only; anything longer is shed instead of piling up into timeouts
+        if not slots.acquire(timeout=cfg["queue_timeout"]):
+            with _admission_lock:
+                stats["rejected_concurrency"] += 1
+            return too_busy(503, "server busy, try again shortly", 1)
+
+    g.admission_slot = endpoint
+    with _admission_lock:
+        stats["admitted"] += 1
+        stats["inflight"] += 1
+    return None
+
+
+@app.teardown_request
+def release_request(exc=None):
+    endpoint = g.pop("admission_slot", None)
+    if endpoint is None:
+        return
+    _route_slots[endpoint].release()
+    with _admission_lock:
+        _admission_stats[endpoint]["inflight"] -= 1
+
+
+@app.route("/admission_stats", methods=["GET"])
+def admission_stats():
+    with _admission_lock:
+        out = {
+            ep: dict(stats, limits=dict(ROUTE_LIMITS[ep]))
+            for ep, stats in _admission_stats.items()
+        }
+    return jsonify(out), 200
+
+
 # -----------------------
 # Health
 # -----------------------
@@ -360,6 +908,7 @@ def create_user():
         # set a stable IC (e.g., IC-0001)
         candidate.ic_number = f"IC-{candidate.id:04d}"
         db.session.commit()
+        index_candidate(candidate)
     except Exception as e:
         db.session.rollback()
         log.exception("Failed to create Candidate: %s", e)
@@ -477,8 +1026,10 @@ def verify_candidate():
     ic_number = data.get("ic_number") or data.get("ic")
     if not name or not ic_number:
         return jsonify({"error": "name and ic_number are required"}), 400
-    candidate = Candidate.query.filter_by(name=name, ic_number=ic_number).first()
-    if not candidate:
+    # IC must match exactly; the name only needs to be close ("Tan Ze Qi" vs "Tan Zeqi")
+    candidate = Candidate.query.filter_by(ic_number=ic_number).first()
+    if not candidate or (candidate.name != name and
+                         similarity(trigrams(name), trigrams(candidate.name)) < VERIFY_MIN_SCORE):
         return jsonify({"error": "Candidate not found"}), 404
     return jsonify({
         "message": "Candidate verified successfully.",
@@ -504,6 +1055,15 @@ def add_candidate():
     if candidate:
         return jsonify({"error": "Candidate already exists"}), 400
 
+    # fuzzy dedupe on name; pass "force": true to add anyway
+    if not data.get("force"):
+        likely = [c for _, c in lookup_candidates(name, limit=5, min_score=DUPLICATE_MIN_SCORE)]
+        if likely:
+            return jsonify({
+                "error": "Possible duplicate candidate",
+                "possible_duplicates": [{"id": c.id, "name": c.name, "ic_number": c.ic_number, "email": c.email} for c in likely]
+            }), 409
+
     email = f"{email_prefix}@company.com" if email_prefix else None
     try:
         new_candidate = Candidate(name=name, ic_number=ic_number, position=position, email=email)
@@ -512,6 +1072,7 @@ def add_candidate():
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": "failed to add candidate", "details": str(e)}), 500
+    index_candidate(new_candidate)
 
     return jsonify({
         "message": f"Candidate {name} added successfully.",
@@ -519,6 +1080,56 @@ def add_candidate():
     }), 201
 
 
+# -----------------------
+# API: candidate fuzzy lookup + duplicate clusters
+# -----------------------
+@app.route("/candidates/lookup", methods=["GET"])
+def candidate_lookup():
+    q = (request.args.get("q") or "").strip()[:200]
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 50))
+        min_score = float(request.args.get("min_score", LOOKUP_MIN_SCORE))
+    except ValueError:
+        return jsonify({"error": "limit and min_score must be numbers"}), 400
+
+    matches = lookup_candidates(q, limit=limit, min_score=min_score)
+    return jsonify({
+        "query": q,
+        "matches": [
+            {"id": c.id, "name": c.name, "email": c.email or "", "ic": c.ic_number,
+             "position": c.position, "score": round(score, 3)}
+            for score, c in matches
+        ]
+    }), 200
+
+
+@app.route("/candidates/duplicates", methods=["GET"])
+def candidate_duplicates():
+    try:
+        min_score = float(request.args.get("min_score", DUPLICATE_MIN_SCORE))
+    except ValueError:
+        return jsonify({"error": "min_score must be a number"}), 400
+
+    clusters, best = find_duplicate_clusters(min_score=min_score)
+    by_id = {c.id: c for c in Candidate.query.filter(Candidate.id.in_(best.keys())).all()} if best else {}
+    out = []
+    for ids in clusters:
+        out.append([
+            {"id": cid, "name": by_id[cid].name, "email": by_id[cid].email or "", "ic": by_id[cid].ic_number,
+             "score": round(best[cid], 3)}
+            for cid in ids if cid in by_id
+        ])
+    return jsonify({"clusters": out}), 200
+
+
+@app.cli.command("rebuild-candidate-index")
+def rebuild_candidate_index_command():
+    """Rebuild the candidate trigram index from scratch."""
+    rebuild_candidate_trigrams()
+
+
 # -----------------------
 # API: resumes
 # -----------------------
@@ -536,7 +1147,11 @@ def get_resumes():
 def ideas():
     if request.method == "GET":
         try:
-            items = Idea.query.order_by(Idea.id.desc()).all()
+            if wants_archived():
+                limit, offset = archive_page()
+                items = read_archive("idea", newest_first=True, limit=limit, offset=offset)
+            else:
+                items = Idea.query.order_by(Idea.id.desc()).all()
             out = [{"id": i.id, "text": i.text, "status": i.status, "submittedAt": i.submitted_at} for i in items]
             return jsonify(out), 200
         except Exception as e:
@@ -559,7 +1174,11 @@ def ideas():
 @app.route("/tasks", methods=["GET", "POST"])
 def tasks_api():
     if request.method == "GET":
-        items = Task.query.order_by(Task.id.asc()).all()
+        if wants_archived():
+            limit, offset = archive_page()
+            items = read_archive("task", limit=limit, offset=offset)
+        else:
+            items = Task.query.order_by(Task.id.asc()).all()
         out = [{"id": t.id, "date": t.date, "task": t.task, "status": t.status, "priority": t.priority} for t in items]
         return jsonify(out), 200
     else:
@@ -607,7 +1226,11 @@ def submit_feedback():
 @app.route("/get_feedbacks", methods=["GET"])
 def get_feedbacks():
     try:
-        feedbacks = Feedback.query.order_by(Feedback.id.desc()).all()
+        if wants_archived():
+            limit, offset = archive_page()
+            feedbacks = read_archive("feedback", newest_first=True, limit=limit, offset=offset)
+        else:
+            feedbacks = Feedback.query.order_by(Feedback.id.desc()).all()
         results = [
             {"id": f.id, "employee_name": f.employee_name, "feedback_text": f.feedback_text}
             for f in feedbacks
@@ -652,7 +1275,11 @@ def add_todo():
 @app.route("/get_todos/<employee_name>", methods=["GET"])
 def get_todos(employee_name):
     try:
-        todos = Todo.query.filter_by(employee_name=employee_name).order_by(Todo.id.asc()).all()
+        if wants_archived():
+            limit, offset = archive_page()
+            todos = read_archive("todo", limit=limit, offset=offset, employee_name=employee_name)
+        else:
+            todos = Todo.query.filter_by(employee_name=employee_name).order_by(Todo.id.asc()).all()
         results = [{"id": t.id, "task": t.task, "is_completed": t.is_completed, "due_date": t.due_date} for t in todos]
         return jsonify({"employee_name": employee_name, "todos": results}), 200
     except Exception as e:
@@ -669,6 +1296,10 @@ def update_todo(todo_id):
         data = request.get_json() or {}
         if "is_completed" in data:
             todo.is_completed = bool(data.get("is_completed"))
+            if not todo.is_completed:
+                todo.completed_at = None
+            elif not todo.completed_at:
+                todo.completed_at = datetime.utcnow().strftime("%Y-%m-%d")
         if "task" in data:
             todo.task = data.get("task")
         if "due_date" in data:
@@ -694,6 +1325,19 @@ def delete_todo(todo_id):
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
 
+# -----------------------
+# Retention job (manual run; normally the in-process timer handles this)
+# -----------------------
+@app.cli.command("run-retention")
+@click.option("--batch-size", default=RETENTION_BATCH_SIZE, show_default=True)
+@click.option("--max-batches", default=None, type=int, help="Stop after this many batches per table.")
+@click.option("--no-vacuum", is_flag=True)
+def run_retention_command(batch_size, max_batches, no_vacuum):
+    """Archive rows older than the retention policy and vacuum this machine's company.db."""
+    result = run_retention(batch_size=batch_size, max_batches=max_batches, vacuum=not no_vacuum)
+    click.echo(json.dumps(result))
+
+
 # -----------------------
 # Root
 # -----------------------